@@ -68,6 +68,7 @@ setup(
     python_requires=">=3.6",
     install_requires=[
         "click",
+        "joblib>=1.3",
         "nibabel",
         "nilearn",
         "nipype",
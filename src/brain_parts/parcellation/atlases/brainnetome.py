@@ -1,12 +1,23 @@
 """
 Definition of the Brainnetome atlas parcellation dictionary.
 """
+import logging
+import os
+import pickle
+import tempfile
+from collections.abc import MutableMapping
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Iterator
 
 import nibabel as nib
+import numpy as np
 import pandas as pd
 
+from brain_parts.parcellation.utils import CACHE_DIR, build_label_lut
+
+logger = logging.getLogger(__name__)
+
 #: MNI-based atlases directory.
 MNI_PATH: Path = Path("/media/groot/Data/Parcellations/MNI")
 
@@ -24,6 +35,17 @@ BRAINNETOME_VOLUME_PATH: Path = MNI_PATH / BRAINNETOME_VOLUME_NAME
 BRAINNETOME_PARCELS_NAME: str = "BNA_with_cerebellum.csv"
 #: Path to the brainnetome parcels CSV.
 BRAINNETOME_PARCELS_PATH: Path = MNI_PATH / BRAINNETOME_PARCELS_NAME
+#: Per-user cache directory, used unless *CACHE_DIR* is set.
+USER_CACHE_DIR: Path = (
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    / "brain_parts"
+)
+#: Directory of pickled parcels tables.
+PARCELS_CACHE_DIR: Path = Path(CACHE_DIR or USER_CACHE_DIR)
+#: Path to a pickled copy of the parcels table, which loads faster than CSV.
+BRAINNETOME_PARCELS_CACHE_PATH: Path = PARCELS_CACHE_DIR / Path(
+    BRAINNETOME_PARCELS_NAME
+).with_suffix(".pkl")
 #
 # GCS
 #
@@ -45,19 +67,166 @@ CTAB_FILE_NAME: str = "BN_Atlas_246_LUT.txt"
 #: ctab file path.
 CTAB_FILE_PATH: Path = BRAINNETOME_FS_PATH / CTAB_FILE_NAME
 
-#: Parcellation's tabled information
-PARCELS = pd.read_csv(BRAINNETOME_PARCELS_PATH, index_col=0)
+
+def _read_parcels(path: Path, cache: Path) -> pd.DataFrame:
+    """
+    Read a parcels table, preferring its pickled copy when it is up to date.
+
+    The copy is written to a temporary file and moved into place, so that
+    concurrent readers never see it half written. Copies that fail to
+    unpickle (e.g. written by another pandas version) are logged and
+    replaced.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the parcels CSV
+    cache : Path
+        Path to the pickled copy of *path*
+
+    Returns
+    -------
+    pd.DataFrame
+        The parcels table
+    """
+    if cache.exists() and cache.stat().st_mtime >= path.stat().st_mtime:
+        try:
+            return pd.read_pickle(cache)
+        except (
+            pickle.UnpicklingError,
+            AttributeError,
+            ImportError,
+            EOFError,
+        ) as exc:
+            logger.warning(
+                f"Replacing unreadable parcels cache {cache}: {exc}"
+            )
+    parcels = pd.read_csv(path, index_col=0)
+    try:
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache.parent, suffix=".tmp")
+    except OSError:
+        return parcels
+    try:
+        with os.fdopen(fd, "wb") as f:
+            parcels.to_pickle(f)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, cache)
+    except OSError:
+        os.unlink(tmp)
+    return parcels
+
+
+@lru_cache(maxsize=None)
+def _load_parcels() -> pd.DataFrame:
+    """
+    Load the Brainnetome parcels table once, on first use.
+
+    Returns
+    -------
+    pd.DataFrame
+        The parcels table
+    """
+    return _read_parcels(
+        BRAINNETOME_PARCELS_PATH, BRAINNETOME_PARCELS_CACHE_PATH
+    )
+
+
+def _build_index() -> pd.MultiIndex:
+    """
+    Build the index of parcellated results from the parcels table.
+
+    Returns
+    -------
+    pd.MultiIndex
+        An index of the parcels' *INDEX_COLUMNS*
+    """
+    return pd.MultiIndex.from_frame(
+        pd.DataFrame(_load_parcels()[INDEX_COLUMNS])
+    )
+
+
+def _build_parcels_label_lut() -> np.ndarray:
+    """
+    Build a dense lookup table of each label's row in the parcels table.
+
+    Returns
+    -------
+    np.ndarray
+        An array whose value at each label is that label's row, or -1 for
+        values that are not parcel labels
+    """
+    return build_label_lut(_load_parcels()["Label"].to_numpy())
+
+
+class _LazyAtlas(MutableMapping):
+    """
+    A parcellation dictionary whose heavy entries are only computed when
+    first accessed, so that importing an atlas does not touch its files.
+    """
+
+    def __init__(self, loaders: Dict[str, Callable[[], Any]], **entries):
+        """
+        Initiate a _LazyAtlas object
+
+        Parameters
+        ----------
+        loaders : Dict[str, Callable[[], Any]]
+            A dictionary of keys and functions computing their values
+        """
+        self.loaders = dict(loaders)
+        self._entries = dict(entries)
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._entries:
+            if key not in self.loaders:
+                raise KeyError(key)
+            self._entries[key] = self.loaders[key]()
+        return self._entries[key]
+
+    def __setitem__(self, key: str, value: Any):
+        self._entries[key] = value
+
+    def __delitem__(self, key: str):
+        if key not in self:
+            raise KeyError(key)
+        self._entries.pop(key, None)
+        self.loaders.pop(key, None)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries or key in self.loaders
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._entries
+        yield from (key for key in self.loaders if key not in self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries.keys() | self.loaders.keys())
+
+    def __repr__(self) -> str:
+        pending = [key for key in self.loaders if key not in self._entries]
+        return f"{type(self).__name__}({self._entries!r}, pending={pending})"
+
+
+def __getattr__(name: str) -> Any:
+    if name == "PARCELS":
+        return _load_parcels()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 #: Label column's name
 INDEX_COLUMNS = ["Label"]
 
 #: Brainnetome atlas parcellation dictionary.
-BRAINNETOME: Dict[str, Any] = {
-    "path": BRAINNETOME_VOLUME_PATH,
-    "image": nib.load(BRAINNETOME_VOLUME_PATH),
-    "parcels": PARCELS,
-    "gcs": GCS_PATH_TEMPLATE,
-    "gcs_subcortex": SUBCORTEX_GCS_PATH,
-    "ctab": CTAB_FILE_PATH,
-    "index": pd.MultiIndex.from_frame(pd.DataFrame(PARCELS[INDEX_COLUMNS])),
-}
+BRAINNETOME: MutableMapping = _LazyAtlas(
+    loaders={
+        "image": partial(nib.load, BRAINNETOME_VOLUME_PATH),
+        "parcels": _load_parcels,
+        "index": _build_index,
+        "label_lut": _build_parcels_label_lut,
+    },
+    path=BRAINNETOME_VOLUME_PATH,
+    gcs=GCS_PATH_TEMPLATE,
+    gcs_subcortex=SUBCORTEX_GCS_PATH,
+    ctab=CTAB_FILE_PATH,
+)
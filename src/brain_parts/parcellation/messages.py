@@ -3,6 +3,7 @@ Messages for the :mod:`brain_parts.parcellation` module.
 """
 ANNOTATION_FILE_GENERATION_START: str = "Generating annotation file for {parcellation_scheme} in {subject_label} {hemisphere_label} space."
 SUBCORTICAL_ANNOTATION_FILE_GENERATION_START: str = "Generating annotation file for {parcellation_scheme}'s sub-cortex in {subject_label} space."
+REUSING_OUTPUTS: str = "Reusing existing {outputs}."
 
 PARCELLATION_ALREADY_DONE = """
 {parcellation_scheme} atlas was already cropped to subject {participant_label}'s gray matter space.
@@ -13,4 +14,7 @@ REGISTRATION_WORKFLOW = """
 {parcellation_scheme} atlas was previously registerted to subject {participant_label}'s individual space.
 To re-run this process, pass force=True as a keyword arguement.
 """
+SHAPE_MISMATCH: str = "{metric_image} has shape {metric_shape}, which does not match the parcellation's {parcellation_shape}."
+NON_INTEGRAL_ATLAS: str = "{atlas} holds non-integral labels, which cannot be used as parcel labels."
+NEGATIVE_ATLAS: str = "{atlas} holds negative labels, which cannot be used as parcel labels."
 # flake8: noqa: E501
@@ -1,29 +1,214 @@
 """
 Definition of the :class:`Parcellation` class.
 """
+import json
 import logging
+import os
+import tempfile
 import warnings
+from functools import lru_cache
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Dict, List, Tuple
 
 import nibabel as nib
 import numpy as np
 import pandas as pd
-from nipype.interfaces import fsl
+from joblib import Parallel, delayed
 from nipype.interfaces.ants import ApplyTransforms
 
 from brain_parts.parcellation.atlases import PARCELLATION_FILES
 from brain_parts.parcellation.messages import (
     PARCELLATION_ALREADY_DONE,
     REGISTRATION_WORKFLOW,
+    SHAPE_MISMATCH,
 )
+from brain_parts.parcellation.utils import (
+    as_labels,
+    build_label_lut,
+    file_key,
+    file_signature,
+)
+
+#: Approximate number of voxels read and aggregated per np.bincount call
+#: when averaging parcels.
+BINCOUNT_TILE_SIZE: int = 2**18
+
+
+@lru_cache(maxsize=32)
+def _load_labels(key: tuple) -> np.ndarray:
+    """
+    Load a parcellation image's labels as a read-only integer array.
+
+    Results are cached by the image's signature, so parcellating several
+    metric images with the same parcellation decodes it only once.
+
+    Parameters
+    ----------
+    key : tuple
+        A parcellation image's signature, as returned by *file_key*
+
+    Returns
+    -------
+    np.ndarray
+        The parcellation's labels
+    """
+    labels = as_labels(
+        np.asanyarray(nib.load(key[0]).dataobj), key[0], np.int32
+    )
+    labels.flags.writeable = False
+    return labels
+
+
+@lru_cache(maxsize=32)
+def _load_foreground(key: tuple) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Locate a parcellation image's labelled (non-background) voxels.
+
+    Background usually makes up most of a volume, so restricting the
+    aggregation to labelled voxels shrinks the data it has to move. Indices
+    refer to the image flattened in Fortran (on-disk) order, so that each
+    slab along the last axis maps to a contiguous range of them.
+
+    Parameters
+    ----------
+    key : tuple
+        A parcellation image's signature, as returned by *file_key*
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        The flat indices of the labelled voxels and their labels
+    """
+    labels = _load_labels(key).ravel(order="F")
+    foreground = np.flatnonzero(labels)
+    return foreground, labels[foreground]
+
+
+@lru_cache(maxsize=32)
+def _label_indices(key: tuple) -> Dict[int, np.ndarray]:
+    """
+    Map each of a parcellation image's labels to the flat indices of its
+    voxels, sorting the labelled voxels by label once.
+
+    Parameters
+    ----------
+    key : tuple
+        A parcellation image's signature, as returned by *file_key*
+
+    Returns
+    -------
+    Dict[int, np.ndarray]
+        A dictionary of labels and the flat indices of their voxels
+    """
+    foreground, labels = _load_foreground(key)
+    order = np.argsort(labels, kind="stable")
+    unique, starts = np.unique(labels[order], return_index=True)
+    indices = np.split(foreground[order], starts[1:])
+    return dict(zip(unique, indices))
+
+
+def _check_shape(metric_image: str, metric_shape: tuple, shape: tuple):
+    """
+    Raise a ValueError unless a metric image lies on the parcellation's grid.
+    """
+    if tuple(metric_shape) != tuple(shape):
+        raise ValueError(
+            SHAPE_MISMATCH.format(
+                metric_image=metric_image,
+                metric_shape=tuple(metric_shape),
+                parcellation_shape=tuple(shape),
+            )
+        )
+
+
+def _load_metric(path: str) -> np.ndarray:
+    """
+    Load a metric image's data as single precision floats.
+
+    Single precision is ample for tensor-derived metrics and halves the
+    memory traffic of parcellating them; means are still accumulated in
+    double precision.
+
+    Parameters
+    ----------
+    path : str
+        Path to a metric image
+
+    Returns
+    -------
+    np.ndarray
+        The metric image's data
+    """
+    return np.asarray(nib.load(path).dataobj, dtype=np.float32)
+
+
+@lru_cache(maxsize=1)
+def _stack_atlases(signature: Tuple[tuple, ...]) -> np.ndarray:
+    """
+    Stack same-grid atlases into a read-only 4D array.
+
+    The latest stack is cached by the atlases' *(path, mtime, size)*
+    signature, so registering them to many subjects decodes them only once
+    while holding a single 4D array in memory.
+
+    Parameters
+    ----------
+    signature : Tuple[tuple, ...]
+        The atlases' signature, as returned by *file_signature*
+
+    Returns
+    -------
+    np.ndarray
+        The atlases stacked along a fourth axis
+    """
+    stacked = np.stack(
+        [np.asanyarray(nib.load(path).dataobj) for path, _, _ in signature],
+        axis=-1,
+    )
+    stacked.flags.writeable = False
+    return stacked
+
+
+def _bounding_box(mask: np.ndarray) -> Tuple[slice, ...]:
+    """
+    Slices spanning the non-zero voxels of *mask*.
+    """
+    bbox = []
+    for axis in range(mask.ndim):
+        other_axes = tuple(i for i in range(mask.ndim) if i != axis)
+        hits = np.flatnonzero(mask.any(axis=other_axes))
+        bbox.append(slice(hits[0], hits[-1] + 1))
+    return tuple(bbox)
+
+
+def _threads_kwargs(num_threads: int = None) -> dict:
+    """
+    *ApplyTransforms* inputs limiting ITK to *num_threads* threads.
+
+    nipype only exports the thread limit when *num_threads* differs from its
+    default of 1, so the environment variable is set explicitly.
+    """
+    if num_threads is None:
+        return {}
+    return dict(
+        num_threads=num_threads,
+        environ={"ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS": str(num_threads)},
+    )
+
+
+def _registration_sidecar(out_whole_brain: Path) -> Path:
+    """
+    Path to the JSON file recording how *out_whole_brain* was registered,
+    named so as not to clash with its BIDS sidecar.
+    """
+    return out_whole_brain.with_name(
+        out_whole_brain.name.split(".")[0] + ".registration.json"
+    )
 
 
 class Parcellation:
     #: Default KWARGS
     APPLY_TRANSFORM_KWARGS = dict(interpolation="NearestNeighbor")
-    THRESHOLD_KWARGS = dict(direction="below")
-    MASKING_KWARGS = dict(output_datatype="int")
 
     def __init__(
         self,
@@ -50,6 +235,7 @@ class Parcellation:
         mni2native_transform: Path,
         out_whole_brain: Path,
         force: bool = False,
+        num_threads: int = None,
     ):
         """
         Register a parcellation scheme to subjects' anatomical space
@@ -64,7 +250,12 @@ class Parcellation:
             A string representing existing key within *self.parcellations*.
         """
 
-        if out_whole_brain.exists() and not force:
+        if not force and self._is_registered(
+            parcellation_scheme,
+            reference,
+            mni2native_transform,
+            out_whole_brain,
+        ):
             self.logger.info(
                 REGISTRATION_WORKFLOW.format(
                     parcellation_scheme=parcellation_scheme,
@@ -85,10 +276,240 @@ class Parcellation:
             reference_image=reference,
             transforms=mni2native_transform,
             output_image=str(out_whole_brain),
+            **_threads_kwargs(num_threads),
             **self.APPLY_TRANSFORM_KWARGS,
         )
         self.logger.info("CMD:\n" + runner.cmdline)
         runner.run()
+        self._write_registration_signature(
+            parcellation_scheme,
+            reference,
+            mni2native_transform,
+            out_whole_brain,
+        )
+
+    def _registration_signature(
+        self,
+        parcellation_scheme: str,
+        reference: Path,
+        mni2native_transform: Path,
+    ) -> dict:
+        """
+        Describe the inputs of a parcellation scheme's registration.
+
+        Parameters
+        ----------
+        parcellation_scheme : str
+            A string representing existing key within *self.parcellations*
+        reference : Path
+            An image in the subject's anatomical space
+        mni2native_transform : Path
+            A transform from standard to the subject's anatomical space
+
+        Returns
+        -------
+        dict
+            *parcellation_scheme* and its inputs' (path, mtime, size)
+        """
+        parcellation_image = self.parcellations.get(parcellation_scheme).get(
+            "path"
+        )
+        inputs = [parcellation_image, reference, mni2native_transform]
+        signature = {
+            "parcellation_scheme": parcellation_scheme,
+            "inputs": file_signature(inputs),
+        }
+        return json.loads(json.dumps(signature))
+
+    def _is_registered(
+        self,
+        parcellation_scheme: str,
+        reference: Path,
+        mni2native_transform: Path,
+        out_whole_brain: Path,
+    ) -> bool:
+        """
+        Check whether *out_whole_brain* was registered from the current
+        inputs. Outputs without a signature sidecar are trusted as is.
+        """
+        out_whole_brain = Path(out_whole_brain)
+        if not out_whole_brain.exists():
+            return False
+        sidecar = _registration_sidecar(out_whole_brain)
+        if not sidecar.exists():
+            return True
+        return json.loads(sidecar.read_text()) == self._registration_signature(
+            parcellation_scheme, reference, mni2native_transform
+        )
+
+    def _write_registration_signature(
+        self,
+        parcellation_scheme: str,
+        reference: Path,
+        mni2native_transform: Path,
+        out_whole_brain: Path,
+    ):
+        signature = self._registration_signature(
+            parcellation_scheme, reference, mni2native_transform
+        )
+        _registration_sidecar(Path(out_whole_brain)).write_text(
+            json.dumps(signature, indent=4)
+        )
+
+    def register_parcellation_schemes(
+        self,
+        parcellation_schemes: List[str],
+        participant_label: str,
+        reference: Path,
+        mni2native_transform: Path,
+        out_whole_brains: List[Path],
+        force: bool = False,
+        num_threads: int = None,
+    ):
+        """
+        Register several parcellation schemes to subjects' anatomical space
+        with a single *antsApplyTransforms* call.
+
+        Atlases sharing a grid are stacked into a 4D image and warped together;
+        otherwise each scheme is registered separately.
+
+        Parameters
+        ----------
+        parcellation_schemes : List[str]
+            Strings representing existing keys within *self.parcellations*
+        participant_label : str
+            A label referring to an existing subject
+        reference : Path
+            An image in the subject's anatomical space
+        mni2native_transform : Path
+            A transform from standard to the subject's anatomical space
+        out_whole_brains : List[Path]
+            Output paths, one per parcellation scheme
+        num_threads : int, optional
+            Number of threads used by *antsApplyTransforms*, by default
+            ITK's
+        """
+        pending = {}
+        for parcellation_scheme, out_whole_brain in zip(
+            parcellation_schemes, out_whole_brains
+        ):
+            if not force and self._is_registered(
+                parcellation_scheme,
+                reference,
+                mni2native_transform,
+                out_whole_brain,
+            ):
+                self.logger.info(
+                    REGISTRATION_WORKFLOW.format(
+                        parcellation_scheme=parcellation_scheme,
+                        participant_label=participant_label,
+                    )
+                )
+            else:
+                pending[parcellation_scheme] = Path(out_whole_brain)
+        images = [
+            nib.load(str(self.parcellations.get(scheme).get("path")))
+            for scheme in pending
+        ]
+        if len(images) < 2 or not all(
+            image.shape == images[0].shape
+            and np.allclose(image.affine, images[0].affine)
+            for image in images[1:]
+        ):
+            for parcellation_scheme, out_whole_brain in pending.items():
+                self.register_parcellation_scheme(
+                    parcellation_scheme,
+                    participant_label,
+                    reference,
+                    mni2native_transform,
+                    out_whole_brain,
+                    force=True,
+                    num_threads=num_threads,
+                )
+            return
+        self.logger.info(
+            f"Transforming {', '.join(pending)} atlases from standard to subject {participant_label}'s individual space."  # noqa: E501
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stack, out_stack = [
+                Path(tmp_dir) / name for name in ["stack.nii", "out_stack.nii"]
+            ]
+            stacked = _stack_atlases(
+                tuple(
+                    file_signature(
+                        self.parcellations.get(scheme).get("path")
+                        for scheme in pending
+                    )
+                )
+            )
+            nib.save(nib.Nifti1Image(stacked, images[0].affine), stack)
+            runner = ApplyTransforms(
+                input_image=str(stack),
+                reference_image=reference,
+                transforms=mni2native_transform,
+                output_image=str(out_stack),
+                input_image_type=3,
+                **_threads_kwargs(num_threads),
+                **self.APPLY_TRANSFORM_KWARGS,
+            )
+            self.logger.info("CMD:\n" + runner.cmdline)
+            runner.run()
+            for (parcellation_scheme, out_whole_brain), image in zip(
+                pending.items(), nib.four_to_three(nib.load(str(out_stack)))
+            ):
+                nib.save(image, out_whole_brain)
+                self._write_registration_signature(
+                    parcellation_scheme,
+                    reference,
+                    mni2native_transform,
+                    out_whole_brain,
+                )
+
+    def register_participants(
+        self,
+        parcellation_schemes: List[str],
+        participants: Dict[str, Tuple[Path, Path, List[Path]]],
+        force: bool = False,
+        n_jobs: int = None,
+    ):
+        """
+        Register several parcellation schemes to many subjects' anatomical
+        space, one subject per process.
+
+        Parameters
+        ----------
+        parcellation_schemes : List[str]
+            Strings representing existing keys within *self.parcellations*
+        participants : Dict[str, Tuple[Path, Path, List[Path]]]
+            Subjects' labels mapped to their reference image, standard to
+            native transform and output paths (one per parcellation scheme)
+        n_jobs : int, optional
+            Number of subjects registered in parallel, by default
+            *os.cpu_count()*. Available cores are split between the
+            subjects' *antsApplyTransforms* calls to avoid oversubscription.
+
+        Log messages emitted in worker processes only reach the application's
+        handlers when *n_jobs* is 1, since workers do not inherit its logging
+        configuration.
+        """
+        n_jobs = n_jobs or os.cpu_count()
+        num_threads = max(1, os.cpu_count() // n_jobs)
+        Parallel(n_jobs=n_jobs, prefer="processes")(
+            delayed(self.register_parcellation_schemes)(
+                parcellation_schemes,
+                participant_label,
+                reference,
+                mni2native_transform,
+                out_whole_brains,
+                force=force,
+                num_threads=num_threads,
+            )
+            for participant_label, (
+                reference,
+                mni2native_transform,
+                out_whole_brains,
+            ) in participants.items()
+        )
 
     def crop_to_probseg(
         self,
@@ -109,21 +530,33 @@ class Parcellation:
                 )
             )  # noqa: E501           )
             return
-        threshold_runner = fsl.Threshold(
-            in_file=probseg,
-            thresh=masking_threshold,
-            out_file=mask,
-            **self.THRESHOLD_KWARGS,
+        whole_brain_img = nib.load(str(whole_brain))
+        probseg_data = np.asanyarray(nib.load(str(probseg)).dataobj)
+        # Matches fslmaths' -thr (keeps values >= threshold) followed by
+        # -mas (keeps non-zero voxels).
+        mask_data = (probseg_data >= masking_threshold) & (probseg_data != 0)
+        # Only the mask's bounding box is read from the parcellation proxy.
+        cropped = np.zeros(whole_brain_img.shape, dtype=np.int32)
+        if mask_data.any():
+            bbox = _bounding_box(mask_data)
+            cropped[bbox] = as_labels(
+                np.asanyarray(whole_brain_img.dataobj[bbox]),
+                whole_brain,
+                np.int32,
+            )
+            cropped[bbox] *= mask_data[bbox]
+        header = whole_brain_img.header.copy()
+        header.set_data_dtype(np.int32)
+        nib.save(
+            nib.Nifti1Image(
+                mask_data.astype(np.uint8), whole_brain_img.affine
+            ),
+            mask,
         )
-        threshold_runner.run()
-        masking_runner = fsl.ApplyMask(
-            in_file=whole_brain,
-            mask_file=mask,
-            out_file=out_cropped,
-            **self.MASKING_KWARGS,
+        nib.save(
+            nib.Nifti1Image(cropped, whole_brain_img.affine, header),
+            out_cropped,
         )
-        self.logger.info("CMD:\n" + masking_runner.cmdline)
-        masking_runner.run()
 
     def parcellate_image(
         self,
@@ -152,19 +585,178 @@ class Parcellation:
         pd.Series
             A series of the mean value in each *parcellation_scheme*'s parcel.
         """
+        metric_name = metric_name or Path(metric_image).name.split(".")[0]
+        return self.parcellate_images(
+            parcellation_scheme,
+            parcellation_image,
+            [metric_image],
+            metric_names=[metric_name],
+            measure=measure,
+        )[metric_name]
+
+    def parcellate_images(
+        self,
+        parcellation_scheme: str,
+        parcellation_image: Path,
+        metric_images: List[Path],
+        metric_names: List[str] = None,
+        measure: Callable = np.nanmean,
+    ) -> pd.DataFrame:
+        """
+        Parcellate several metric images sharing the same native-space
+        *parcellation_image*, which is loaded and grouped only once.
+
+        Parameters
+        ----------
+        parcellation_scheme : str
+            A string representing existing key within *self.parcellations*.
+        parcellation_image : Path
+            A parcellation image in participant's native space
+        metric_images : List[Path]
+            Images of specific metrics to be parcellated
+        metric_names : List[str], optional
+            Metrics' names, by default None
+
+        Returns
+        -------
+        pd.DataFrame
+            A dataframe of the *measure* of each metric (columns) in each
+            *parcellation_scheme*'s parcel (rows).
+        """
         parcellation = self.parcellations.get(parcellation_scheme)
-        index, parcels = [
-            parcellation.get(key) for key in ["index", "parcels"]
+        index, parcels, label_lut = [
+            parcellation.get(key) for key in ["index", "parcels", "label_lut"]
         ]
-        metric_name = metric_name or Path(metric_image).name.split(".")[0]
-        parcellation_data, metric_data = [
-            nib.load(image).get_fdata()
-            for image in [parcellation_image, metric_image]
+        if label_lut is None:
+            label_lut = build_label_lut(parcels["Label"].to_numpy())
+        metric_names = metric_names or [
+            Path(metric_image).name.split(".")[0]
+            for metric_image in metric_images
         ]
-        result = pd.Series(index=index, name=metric_name, dtype=float)
-        for label in parcels["Label"]:
-            mask = parcellation_data == label
-            with warnings.catch_warnings():
-                warnings.filterwarnings("ignore", category=RuntimeWarning)
-                result.loc[label] = measure(metric_data[mask].ravel())
+        result = {}
+        for metric_image, metric_name in zip(metric_images, metric_names):
+            if measure is np.nanmean:
+                result[metric_name] = self._parcellate_nanmean(
+                    str(parcellation_image),
+                    str(metric_image),
+                    label_lut,
+                    index,
+                )
+            else:
+                result[metric_name] = self._parcellate_measure(
+                    str(parcellation_image),
+                    str(metric_image),
+                    label_lut,
+                    index,
+                    measure,
+                )
+        result = pd.DataFrame(result, columns=metric_names)
         return pd.concat({parcellation_scheme: result}, names=["Atlas"])
+
+    @staticmethod
+    def _parcellate_nanmean(
+        parcellation_image: str,
+        metric_image: str,
+        label_lut: np.ndarray,
+        index: pd.MultiIndex,
+    ) -> pd.Series:
+        """
+        Compute the NaN-ignoring mean of each parcel in a single pass over the
+        volume, by grouping voxels with :func:`np.bincount`.
+
+        The metric image is streamed from disk in slabs of roughly
+        *BINCOUNT_TILE_SIZE* voxels along its last axis, so it is never fully
+        held in memory and each slab's temporary arrays stay in cache. Slabs
+        without labelled voxels are not read at all.
+
+        Parameters
+        ----------
+        parcellation_image : str
+            Path to a parcellation image in the metric image's space
+        metric_image : str
+            Path to the metric image to be averaged
+        label_lut : np.ndarray
+            Lookup table of each parcel label's row in *index*
+        index : pd.MultiIndex
+            Index of the returned series
+
+        Returns
+        -------
+        pd.Series
+            A series of the mean value in each parcel
+        """
+        key = file_key(parcellation_image)
+        shape = _load_labels(key).shape
+        foreground, labels = _load_foreground(key)
+        metric = nib.load(metric_image, keep_file_open=True).dataobj
+        _check_shape(metric_image, metric.shape, shape)
+        n_bins = max(labels.max(initial=0) + 1, label_lut.size)
+        sums = np.zeros(n_bins)
+        counts = np.zeros(n_bins, dtype=np.int64)
+        slab_size = np.prod(shape[:-1])
+        thickness = max(1, BINCOUNT_TILE_SIZE // slab_size)
+        for start in range(0, shape[-1], thickness):
+            stop = min(start + thickness, shape[-1])
+            first, last = np.searchsorted(
+                foreground, [start * slab_size, stop * slab_size]
+            )
+            if first == last:
+                continue
+            values = np.asarray(metric[..., start:stop], dtype=np.float32)
+            values = values.ravel(order="F")
+            values = values[foreground[first:last] - start * slab_size]
+            finite = ~np.isnan(values)
+            slab_labels = labels[first:last][finite]
+            sums += np.bincount(
+                slab_labels, weights=values[finite], minlength=n_bins
+            )
+            counts += np.bincount(slab_labels, minlength=n_bins)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+        parcel_labels = np.flatnonzero(label_lut >= 0)
+        result = np.empty(len(index))
+        result[label_lut[parcel_labels]] = means[parcel_labels]
+        return pd.Series(result, index=index)
+
+    @staticmethod
+    def _parcellate_measure(
+        parcellation_image: str,
+        metric_image: str,
+        label_lut: np.ndarray,
+        index: pd.MultiIndex,
+        measure: Callable,
+    ) -> pd.Series:
+        """
+        Apply an arbitrary *measure* to each parcel's values, gathered by the
+        parcellation's cached voxel indices.
+
+        Parameters
+        ----------
+        parcellation_image : str
+            Path to a parcellation image in the metric image's space
+        metric_image : str
+            Path to the metric image to be parcellated
+        label_lut : np.ndarray
+            Lookup table of each parcel label's row in *index*
+        index : pd.MultiIndex
+            Index of the returned series
+        measure : Callable
+            A function reducing an array of values to a single value
+
+        Returns
+        -------
+        pd.Series
+            A series of the *measure* in each parcel
+        """
+        key = file_key(parcellation_image)
+        metric_data = _load_metric(metric_image)
+        _check_shape(metric_image, metric_data.shape, _load_labels(key).shape)
+        indices = _label_indices(key)
+        values = metric_data.ravel(order="F")
+        result = np.full(len(index), np.nan)
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=RuntimeWarning)
+            for label, voxels in indices.items():
+                if label < label_lut.size and label_lut[label] >= 0:
+                    result[label_lut[label]] = measure(values[voxels])
+        return pd.Series(result, index=index)
@@ -1,13 +1,18 @@
+import hashlib
 import logging
 import os
+import signal
+import subprocess
 import warnings
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Iterable, Union
+from typing import Callable, Dict, Iterable, List, Set, Tuple, Union
 
 import nibabel as nib
 import numpy as np
 import pandas as pd
 import tqdm
+from joblib import Memory, Parallel, delayed
 from nilearn.image import resample_to_img
 from nipype.interfaces.ants import ApplyTransforms
 from nipype.interfaces.freesurfer import (
@@ -22,6 +27,8 @@ from brain_parts.parcellation import messages
 warnings.filterwarnings("ignore")
 
 
+#: Module logger; handlers are left to the application.
+logger = logging.getLogger(__name__)
 #: Default parcellation logging configuration.
 LOGGER_CONFIG = dict(
     filemode="w",
@@ -29,8 +36,15 @@ LOGGER_CONFIG = dict(
     level=logging.INFO,
 )
 
+#: Directory of the on-disk cache of external tool runs (disabled if unset).
+CACHE_DIR: str = os.environ.get("BRAIN_PARTS_CACHE")
+#: Cache of external tool runs, keyed by their arguments and input files.
+MEMORY = Memory(location=CACHE_DIR, verbose=0)
+
 #: Command template to be used to run dwi2tensor.
 DWI2TENSOR_COMMAND_TEMPLATE: str = "dwi2tensor -grad {grad} {dwi} {out_file}"
+#: MRtrix3 option limiting a command's number of threads.
+MRTRIX_NTHREADS_TEMPLATE: str = "-nthreads {nthreads}"
 #: Custom mapping of dwi2tensor keyword arguments.
 TENSOR2METRIC_KWARGS_MAPPING: Dict[str, str] = {"eval": "value"}
 #: QSIPrep DWI file template.
@@ -47,6 +61,12 @@ HEMISPHERE_LABELS: Iterable[str] = ["lh", "rh"]
 SURFACES: Iterable[str] = ["smoothwm", "curv", "sulc"]
 #: Data types in file name templates.
 DATA_TYPES: Iterable[str] = ["pial", "white"]
+#: mris_anatomical_stats surface parameter keys and file names.
+SURFACE_ARGS: List[Tuple[str, str]] = [
+    (f"{hemi}_{datatype}", f"{hemi}.{datatype}")
+    for hemi in HEMISPHERE_LABELS
+    for datatype in DATA_TYPES
+]
 #: Registered file name template.
 REG_FILE_NAME_TEMPLATE: str = "{hemisphere_label}.sphere.reg"
 #: FreeSurfer's surfaces directory name.
@@ -86,6 +106,173 @@ STATS_NAME_TEMPLATE: str = (
     "{hemisphere_label}_{parcellation_scheme}_{measure}.csv"
 )
 SUBCORTICAL_STATS_NAME_TEMPLATE: str = "subcortex.{parcellation_scheme}.stats"
+#: NumPy reductions available to parcellate images with, by name.
+NP_OPERATIONS: Dict[str, Callable] = {
+    "nanmean": np.nanmean,
+    "nanstd": np.nanstd,
+    "nanmedian": np.nanmedian,
+    "mean": np.mean,
+    "std": np.std,
+    "median": np.median,
+}
+#: Resampled atlas file name template.
+RESAMPLED_ATLAS_NAME_TEMPLATE: str = (
+    "{atlas_name}_res-{shape}_grid-{grid}_src-{source}.nii.gz"
+)
+#: Largest distance from an integer at which float labels are rounded.
+LABEL_TOLERANCE: float = 1e-3
+#: Operations computed for all parcels at once with np.bincount.
+BINCOUNT_OPERATIONS: Iterable[str] = ["nanmean", "mean"]
+#: Minimum number of seconds between progress bar refreshes.
+PROGRESS_MININTERVAL: float = 5.0
+
+
+def file_signature(paths: Iterable[Path]) -> List[tuple]:
+    """
+    Summarize *paths* by their modification time and size.
+
+    Parameters
+    ----------
+    paths : Iterable[Path]
+        Paths to files
+
+    Returns
+    -------
+    List[tuple]
+        A *(path, mtime, size)* tuple for each existing file in *paths*
+    """
+    signature = []
+    for path in map(Path, paths):
+        if path.is_file():
+            stat = path.stat()
+            signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return signature
+
+
+def file_key(path: Path) -> tuple:
+    """
+    Identify a file by its resolved path, modification time and size, so
+    that caches keyed on it are invalidated when the file is rewritten.
+
+    Parameters
+    ----------
+    path : Path
+        Path to a file
+
+    Returns
+    -------
+    tuple
+        The file's *(path, mtime, size)* signature
+    """
+    signature = file_signature([Path(path).resolve()])
+    if not signature:
+        raise FileNotFoundError(path)
+    return signature[0]
+
+
+def as_labels(
+    data: np.ndarray, atlas: Path, dtype: np.dtype = None
+) -> np.ndarray:
+    """
+    Check an atlas's data holds parcel labels and cast them to integers.
+
+    Float data (e.g. warped by *antsApplyTransforms*) is rounded, as long as
+    it lies within *LABEL_TOLERANCE* of integers.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        An atlas's data
+    atlas : Path
+        Path to the atlas, for error messages
+    dtype : np.dtype, optional
+        Integer type of the returned labels, by default the smallest
+        unsigned type that holds them
+
+    Returns
+    -------
+    np.ndarray
+        *data* as integer labels
+
+    Raises
+    ------
+    ValueError
+        If *data* holds negative, non-integral or non-finite values
+    """
+    if data.dtype.kind == "f":
+        rounded = np.rint(data)
+        if not np.all(np.abs(data - rounded) <= LABEL_TOLERANCE):
+            raise ValueError(messages.NON_INTEGRAL_ATLAS.format(atlas=atlas))
+        data = rounded
+    if data.min(initial=0) < 0:
+        raise ValueError(messages.NEGATIVE_ATLAS.format(atlas=atlas))
+    dtype = dtype or np.min_scalar_type(int(data.max(initial=0)))
+    return data.astype(dtype, copy=False)
+
+
+def build_label_lut(labels: np.ndarray) -> np.ndarray:
+    """
+    Build a dense lookup table of each label's position in *labels*.
+
+    Parameters
+    ----------
+    labels : np.ndarray
+        A parcellation scheme's parcel labels
+
+    Returns
+    -------
+    np.ndarray
+        An array whose value at each label is that label's position, or -1
+        for values that are not parcel labels
+    """
+    label_lut = np.full(labels.max() + 1, -1, dtype=np.int32)
+    label_lut[labels] = np.arange(labels.size)
+    return label_lut
+
+
+def _run_interface(interface: type, kwargs: dict, signature: List[tuple]):
+    interface(**kwargs).run()
+
+
+def run_interface(
+    interface: type,
+    inputs: Iterable[Path],
+    outputs: Iterable[Path],
+    message: str = None,
+    **kwargs,
+):
+    """
+    Run a nipype *interface* unless its *outputs* already exist.
+
+    When *MEMORY* is enabled (see *CACHE_DIR*), existing *outputs* are only
+    reused if they were produced by the same arguments from unchanged
+    *inputs*.
+
+    Parameters
+    ----------
+    interface : type
+        A nipype interface class
+    inputs : Iterable[Path]
+        Files read by *interface*
+    outputs : Iterable[Path]
+        Files written by *interface*
+    message : str, optional
+        Logged only if *interface* is run
+    """
+    cached = MEMORY.cache(_run_interface)
+    signature = file_signature(inputs)
+    outputs = [str(output) for output in outputs]
+    if all(Path(output).exists() for output in outputs) and (
+        MEMORY.location is None
+        or cached.check_call_in_cache(interface, kwargs, signature)
+    ):
+        logger.info(
+            messages.REUSING_OUTPUTS.format(outputs=", ".join(outputs))
+        )
+        return
+    if message:
+        logger.info(message)
+    cached.call(interface, kwargs, signature)
 
 
 def generate_annotation_file(
@@ -99,10 +286,7 @@ def generate_annotation_file(
     # Check for existing file in expected output path.
     out_file_name = f"{hemisphere_label}.{parcellation_scheme}.annot"
     out_file = labels_dir / out_file_name
-    if out_file.exists():
-        return out_file
-    # If no existing output is found, create mris_ca_label input
-    # configuration.
+    # Create mris_ca_label input configuration.
     reg_file_name = REG_FILE_NAME_TEMPLATE.format(
         hemisphere_label=hemisphere_label
     )
@@ -112,15 +296,18 @@ def generate_annotation_file(
         for surface_label in SURFACES
     ]
     hemi_gcs = gcs_template.format(hemi=hemisphere_label)
-    # Log annotation file generation start.
+    # Log annotation file generation start (if not up to date).
     message = messages.ANNOTATION_FILE_GENERATION_START.format(
         parcellation_scheme=parcellation_scheme,
         subject_label=subject_dir.name,
         hemisphere_label=hemisphere_label,
     )
-    logging.info(message)
-    # Create interface instance, run, and return the result.
-    ca_label = MRIsCALabel(
+    # Run the interface (unless up to date) and return the result.
+    run_interface(
+        MRIsCALabel,
+        [reg_file, curv, smoothwm, sulc, hemi_gcs],
+        [out_file],
+        message,
         canonsurf=reg_file,
         subjects_dir=subject_dir.parent,
         curv=curv,
@@ -132,7 +319,6 @@ def generate_annotation_file(
         classifier=hemi_gcs,
         seed=42,
     )
-    ca_label.run()
     return out_file
 
 
@@ -164,12 +350,15 @@ def generate_annotations(
         *.annot* files
     """
     subject_dir = freesurfer_dir / subject_label
-    return {
-        hemisphere_label: generate_annotation_file(
+    annotation_files = Parallel(
+        n_jobs=len(HEMISPHERE_LABELS), prefer="threads"
+    )(
+        delayed(generate_annotation_file)(
             subject_dir, hemisphere_label, parcellation_scheme, gcs_template
         )
         for hemisphere_label in HEMISPHERE_LABELS
-    }
+    )
+    return dict(zip(HEMISPHERE_LABELS, annotation_files))
 
 
 def generate_default_args(freesurfer_dir: Path, subject_label: str) -> dict:
@@ -192,15 +381,15 @@ def generate_default_args(freesurfer_dir: Path, subject_label: str) -> dict:
     subject_dir = freesurfer_dir / subject_label
     surface_dir = subject_dir / SURFACES_DIR_NAME
     mri_dir = subject_dir / MRI_DIR_NAME
-    args = {"subject_id": subject_label, "subjects_dir": freesurfer_dir}
-    for hemi in HEMISPHERE_LABELS:
-        for datatype in DATA_TYPES:
-            key = f"{hemi}_{datatype}"
-            file_name = f"{hemi}.{datatype}"
-            args[key] = surface_dir / file_name
-    for key, value in zip(STATS_KEYS, STATS_VALUES):
-        args[key] = mri_dir / value
-    return args
+    return {
+        "subject_id": subject_label,
+        "subjects_dir": freesurfer_dir,
+        **{key: surface_dir / file_name for key, file_name in SURFACE_ARGS},
+        **{
+            key: mri_dir / value if isinstance(value, str) else value
+            for key, value in zip(STATS_KEYS, STATS_VALUES)
+        },
+    }
 
 
 def map_subcortex(
@@ -234,26 +423,26 @@ def map_subcortex(
     subject_dir = freesurfer_dir / subject_label
     mri_dir = subject_dir / MRI_DIR_NAME
     out_file = mri_dir / f"{parcellation_scheme}_subcortex.mgz"
-    if out_file.exists():
-        return out_file
-    # Create a subcortical annotations file if none was found.
+    # Create a subcortical annotations file.
     target = mri_dir / "brain.mgz"
     transform = mri_dir / "transforms" / "talairach.m3z"
-    # Log subcortical annotations file generation start.
+    # Log subcortical annotations file generation start (if not up to date).
     message = messages.SUBCORTICAL_ANNOTATION_FILE_GENERATION_START.format(
         parcellation_scheme=parcellation_scheme,
         subject_label=subject_label,
     )
-    logging.info(message)
-    # Create interface instance, run, and return result.
-    ca_label = CALabel(
+    # Run the interface (unless up to date) and return the result.
+    run_interface(
+        CALabel,
+        [target, transform, gcs_subcrotex],
+        [out_file],
+        message,
         subjects_dir=freesurfer_dir,
         in_file=target,
         transform=transform,
         out_file=out_file,
         template=gcs_subcrotex,
     )
-    ca_label.run()
     return out_file
 
 
@@ -294,15 +483,16 @@ def freesurfer_subcortical_parcellation(
         parcellation_scheme=parcellation_scheme
     )
     summary_file = stats_dir / file_name
-    if not summary_file.exists():
-        ss = SegStats(
-            segmentation_file=mapped_subcortex,
-            subjects_dir=freesurfer_dir,
-            summary_file=summary_file,
-            color_table_file=color_table,
-            exclude_id=0,
-        )
-        ss.run()
+    run_interface(
+        SegStats,
+        [mapped_subcortex, color_table],
+        [summary_file],
+        segmentation_file=mapped_subcortex,
+        subjects_dir=freesurfer_dir,
+        summary_file=summary_file,
+        color_table_file=color_table,
+        exclude_id=0,
+    )
     return summary_file
 
 
@@ -350,14 +540,92 @@ def freesurfer_anatomical_parcellation(
         args["hemisphere"] = hemisphere_label
         args["in_annotation"] = annotations_path
         args["thickness"] = surfaces_dir / f"{hemisphere_label}.thickness"
-        if not out_table.exists() or not out_color.exists():
-            parcstats = ParcellationStats(**args)
-            parcstats.run()
+        run_interface(
+            ParcellationStats,
+            [annotations_path, args["thickness"]],
+            [out_table, out_color],
+            **args,
+        )
         stats[hemisphere_label]["table"] = out_table
         stats[hemisphere_label]["color"] = out_color
     return stats
 
 
+def run_command(template: str, **kwargs):
+    """
+    Run a command-line *template* without a shell.
+
+    *template* is split into arguments before formatting, so paths containing
+    spaces are passed as single arguments. An argument consisting of a single
+    placeholder for a list (e.g. *{subjects}*) is expanded into one argument
+    per item.
+
+    Parameters
+    ----------
+    template : str
+        A command template (e.g. *DWI2TENSOR_COMMAND_TEMPLATE*)
+    """
+    subprocess.run(
+        format_command(template, **kwargs),
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def format_command(template: str, **kwargs) -> List[str]:
+    """
+    Format a command-line *template* into an argument list (see
+    *run_command*).
+
+    Parameters
+    ----------
+    template : str
+        A command template (e.g. *DWI2TENSOR_COMMAND_TEMPLATE*)
+
+    Returns
+    -------
+    List[str]
+        The command's arguments
+    """
+    cmd = []
+    for token in template.split():
+        value = kwargs.get(token.strip("{}")) if token[0] == "{" else None
+        if isinstance(value, (list, tuple)):
+            cmd += [str(item) for item in value]
+        else:
+            cmd.append(token.format(**kwargs))
+    return cmd
+
+
+def pipe_commands(producer: List[str], consumer: List[str]):
+    """
+    Run *producer* with its standard output piped into *consumer*.
+
+    Parameters
+    ----------
+    producer : List[str]
+        Arguments of the command writing to its standard output
+    consumer : List[str]
+        Arguments of the command reading its standard input
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        If either command fails
+    """
+    with subprocess.Popen(producer, stdout=subprocess.PIPE) as upstream:
+        with subprocess.Popen(
+            consumer, stdin=upstream.stdout, stdout=subprocess.DEVNULL
+        ) as downstream:
+            # Let *producer* receive SIGPIPE if *consumer* exits early.
+            upstream.stdout.close()
+    # A failing *producer* usually explains a failing *consumer*.
+    if upstream.returncode not in (0, -signal.SIGPIPE):
+        raise subprocess.CalledProcessError(upstream.returncode, producer)
+    if downstream.returncode:
+        raise subprocess.CalledProcessError(downstream.returncode, consumer)
+
+
 def group_freesurfer_metrics(
     subjects: list,
     destination: Path,
@@ -380,6 +648,8 @@ def group_freesurfer_metrics(
     """
     destination.mkdir(exist_ok=True, parents=True)
     data = {}
+    commands = []
+    existing = list_directory(destination)
     for hemisphere_label in HEMISPHERE_LABELS:
         data[hemisphere_label] = {}
         for measure in STATS_MEASURES:
@@ -389,19 +659,260 @@ def group_freesurfer_metrics(
                 measure=measure,
             )
             out_file = destination / out_file_name
-            if not out_file.exists() or force:
-                cmd = APARCTSTATS2TABLE_TEMPLATE.format(
-                    subjects=" ".join(subjects),
-                    parcellation_scheme=parcellation_scheme,
-                    hemi=hemisphere_label,
-                    measure=measure,
-                    out_file=out_file,
+            if out_file_name not in existing or force:
+                commands.append(
+                    dict(
+                        subjects=list(subjects),
+                        parcellation_scheme=parcellation_scheme,
+                        hemi=hemisphere_label,
+                        measure=measure,
+                        out_file=out_file,
+                    )
                 )
-                os.system(cmd)
             data[hemisphere_label][measure] = out_file
+    if commands:
+        Parallel(n_jobs=min(len(commands), os.cpu_count()), prefer="threads")(
+            delayed(run_command)(APARCTSTATS2TABLE_TEMPLATE, **kwargs)
+            for kwargs in commands
+        )
     return data
 
 
+def query_sessions(base_dir: Path, participant_label: str) -> List[str]:
+    """
+    List a participant's session labels with a single directory scan.
+
+    Parameters
+    ----------
+    base_dir : Path
+        Path to a BIDS-like derivatives directory
+    participant_label : str
+        A label referring to an existing subject
+
+    Returns
+    -------
+    List[str]
+        Sorted session labels (without the *ses-* prefix)
+    """
+    try:
+        with os.scandir(base_dir / f"sub-{participant_label}") as entries:
+            return sorted(
+                entry.name.split("-")[-1]
+                for entry in entries
+                if entry.name.startswith("ses-") and entry.is_dir()
+            )
+    except FileNotFoundError:
+        return []
+
+
+def list_directory(directory: Path) -> Set[str]:
+    """
+    List the entry names in *directory* with a single *os.scandir* call.
+
+    Parameters
+    ----------
+    directory : Path
+        Path to a directory
+
+    Returns
+    -------
+    Set[str]
+        Names of *directory*'s entries (empty if it does not exist)
+    """
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries}
+    except FileNotFoundError:
+        return set()
+
+
+@lru_cache(maxsize=32)
+def _load_image(key: tuple) -> nib.Nifti1Image:
+    """
+    Load (and cache) an image, keyed by its signature so that rewritten files
+    are loaded again.
+
+    Parameters
+    ----------
+    key : tuple
+        A NIfTI image's signature, as returned by *file_key*
+
+    Returns
+    -------
+    nib.Nifti1Image
+        The image, with its data left on disk
+    """
+    return nib.load(key[0], mmap=True)
+
+
+def _same_grid(img: nib.Nifti1Image, reference: nib.Nifti1Image) -> bool:
+    """
+    Check whether *img* and *reference* share a voxel grid.
+
+    Parameters
+    ----------
+    img : nib.Nifti1Image
+        An image
+    reference : nib.Nifti1Image
+        An image defining the target grid
+
+    Returns
+    -------
+    bool
+        Whether *img* and *reference* share shape and affine
+    """
+    return img.shape[:3] == reference.shape[:3] and np.allclose(
+        img.affine, reference.affine, atol=1e-5
+    )
+
+
+def _prepare_atlas(atlas: Path, reference: Path) -> np.ndarray:
+    """
+    Load *atlas*'s labels on *reference*'s grid.
+
+    Atlases on a different grid (shape or affine) are resampled once, and the
+    resampled atlas is saved next to *atlas* so later runs can reuse it. Its
+    name records *atlas*'s modification time and size, so rewriting *atlas*
+    triggers a new resampling.
+
+    Parameters
+    ----------
+    atlas : Path
+        A parcellation atlas in *reference* space
+    reference : Path
+        An image defining the target grid
+
+    Returns
+    -------
+    np.ndarray
+        *atlas*'s labels on *reference*'s grid, as the smallest unsigned
+        integer type that holds them (see *as_labels*)
+    """
+    atlas, reference = Path(atlas), Path(reference)
+    atlas_img, reference_img = [
+        _load_image(file_key(f)) for f in [atlas, reference]
+    ]
+    if not _same_grid(atlas_img, reference_img):
+        resampled = atlas.with_name(
+            RESAMPLED_ATLAS_NAME_TEMPLATE.format(
+                atlas_name=atlas.name.split(".")[0],
+                shape="x".join(map(str, reference_img.shape[:3])),
+                grid=hashlib.md5(
+                    reference_img.affine.round(5).tobytes()
+                ).hexdigest()[:8],
+                source=hashlib.md5(
+                    repr(file_key(atlas)[1:]).encode()
+                ).hexdigest()[:8],
+            )
+        )
+        if resampled.exists():
+            atlas_img = _load_image(file_key(resampled))
+        else:
+            atlas_img = resample_to_img(
+                atlas_img,
+                reference_img,
+                interpolation="nearest",
+            )
+            nib.save(atlas_img, resampled)
+    return as_labels(np.asanyarray(atlas_img.dataobj), atlas)
+
+
+def _build_parcel_index(atlas_data: np.ndarray) -> Dict[int, np.ndarray]:
+    """
+    Map each of *atlas_data*'s labels to its voxels' linear indices.
+
+    Parameters
+    ----------
+    atlas_data : np.ndarray
+        Parcellation labels
+
+    Returns
+    -------
+    Dict[int, np.ndarray]
+        The raveled indices of each non-zero label's voxels
+    """
+    flat = atlas_data.ravel()
+    foreground = np.flatnonzero(flat)
+    order = np.argsort(flat[foreground], kind="stable")
+    sorted_labels = flat[foreground][order]
+    boundaries = np.flatnonzero(np.diff(sorted_labels)) + 1
+    groups = np.split(foreground[order], boundaries)
+    return dict(zip(sorted_labels[np.r_[0, boundaries]].tolist(), groups))
+
+
+def _reduce(
+    image_data: np.ndarray,
+    atlas_data: np.ndarray,
+    labels: np.ndarray,
+    np_operation: str = "nanmean",
+    parcel_index: Dict[int, np.ndarray] = None,
+    label_counts: np.ndarray = None,
+) -> np.ndarray:
+    """
+    Apply *np_operation* to *image_data* in each of *atlas_data*'s parcels.
+
+    Parameters
+    ----------
+    image_data : np.ndarray
+        An image's data
+    atlas_data : np.ndarray
+        Parcellation labels on *image_data*'s grid
+    labels : np.ndarray
+        The labels of the parcels to reduce
+    np_operation : str, optional
+        A key of *NP_OPERATIONS*, by default "nanmean"
+    parcel_index : Dict[int, np.ndarray], optional
+        *atlas_data*'s precomputed parcel index (see *_build_parcel_index*)
+    label_counts : np.ndarray, optional
+        *atlas_data*'s precomputed voxel count per label (see *np.bincount*)
+
+    Returns
+    -------
+    np.ndarray
+        The reduced value of each of *labels*
+    """
+    if np_operation.startswith("nan") and not np.isnan(image_data).any():
+        np_operation = np_operation.replace("nan", "", 1)
+    if np_operation not in BINCOUNT_OPERATIONS:
+        if parcel_index is None:
+            parcel_index = _build_parcel_index(atlas_data)
+        reduce, values = NP_OPERATIONS[np_operation], image_data.ravel()
+        return np.array(
+            [
+                (
+                    reduce(values[parcel_index[label]])
+                    if label in parcel_index
+                    else np.nan
+                )
+                for label in labels.tolist()
+            ],
+            dtype=float,
+        )
+    atlas_data, image_data = atlas_data.ravel(), image_data.ravel()
+    if np_operation.startswith("nan"):
+        valid = ~np.isnan(image_data)
+        atlas_data, image_data = atlas_data[valid], image_data[valid]
+        label_counts = None
+    n_bins = int(max(atlas_data.max(initial=0), labels.max())) + 1
+    sums = np.bincount(atlas_data, weights=image_data, minlength=n_bins)
+    if label_counts is not None and label_counts.size >= n_bins:
+        counts = label_counts
+    else:
+        counts = np.bincount(atlas_data, minlength=n_bins)
+    sums, counts = sums[labels], counts[labels]
+    return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def _parcel_labels(parcels: pd.DataFrame) -> np.ndarray:
+    """
+    The atlas label of each of *parcels*' rows: its *Label* column, or its
+    index if it has none.
+    """
+    if "Label" in parcels:
+        return parcels["Label"].to_numpy()
+    return parcels.index.to_numpy()
+
+
 def parcellate_image(
     atlas: Path, image: Path, parcels: pd.DataFrame, np_operation="nanmean"
 ) -> pd.Series:
@@ -415,28 +926,31 @@ def parcellate_image(
     image : Path
         An image to be parcellated
     parcels : pd.DataFrame
-        A dataframe for *atlas* parcels
+        A dataframe for *atlas* parcels, with their labels in a *Label*
+        column (or as its index)
+    np_operation : str, optional
+        A key of *NP_OPERATIONS* to apply in each parcel, by default "nanmean"
 
     Returns
     -------
     pd.Series
         The mean value of *image* in each *atlas* parcel
     """
-    out = pd.Series(index=parcels.index)
-    try:
-        for i in parcels.index:
-            # TODO: Remove?
-            # callable = getattr(np, np_operation)
-            # out.loc[i] = callable(data[mask])
-            continue
-        return out
-    except IndexError:
-        atlas = resample_to_img(
-            nib.load(atlas),
-            nib.load(image),
-            interpolation="nearest",
-        )
-        return parcellate_image(atlas, image, parcels, np_operation)
+    atlas_data = _prepare_atlas(atlas, image)
+    image_data = np.asanyarray(nib.load(str(image), mmap=True).dataobj)
+    labels = _parcel_labels(parcels)
+    return pd.Series(
+        _reduce(image_data, atlas_data, labels, np_operation),
+        index=parcels.index,
+    )
+
+
+def _digest(*keys) -> str:
+    """
+    Summarize *keys* (e.g. an operation and its inputs' signatures) in a
+    short hexadecimal string, to be used in cache file names.
+    """
+    return hashlib.blake2b(repr(keys).encode(), digest_size=8).hexdigest()
 
 
 def parcellate_subject_tensors(
@@ -469,19 +983,27 @@ def parcellate_subject_tensors(
     parcellation_scheme : str
         The name of the parcellation scheme
 
+    Each session's results are written to a CSV, and cached in a hidden
+    pickle beside it whose name records *np_operation* and the signature of
+    its input files. A session is recomputed whenever the parcellation or a
+    metric image changes, or its CSV is missing, and the previous pickle is
+    removed.
+
     Returns
     -------
     pd.DataFrame
         A dataframe containing all of *participant_label*'s data, parcellated
         by *parcellation_scheme*
     """
-    sessions = [
-        s.name.split("-")[-1]
-        for s in dmriprep_dir.glob(f"sub-{participant_label}/ses-*")
-    ]
+    sessions = query_sessions(dmriprep_dir, participant_label)
     multi_index = pd.MultiIndex.from_product([[participant_label], sessions])
-    subj_data = pd.DataFrame(index=multi_index, columns=multi_column)
-    for session in sessions:
+    values = np.full((len(sessions), len(multi_column)), np.nan)
+    metric_positions = {
+        metric: np.flatnonzero(multi_column.get_level_values(-1) == metric)
+        for metric in multi_column.levels[-1]
+    }
+    labels = _parcel_labels(parcels)
+    for i, session in enumerate(sessions):
         out_file = Path(
             TENSOR_METRICS_OUTPUT_TEMPLATE.format(
                 dmriprep_dir=dmriprep_dir,
@@ -495,30 +1017,73 @@ def parcellate_subject_tensors(
             out_name = out_file.name.split("_")
             out_name.insert(3, "label-GM")
             out_file = out_file.parent / "_".join(out_name)
-        if out_file.exists() and not force:
-            data = pd.read_csv(out_file, index_col=[0, 1], header=[0, 1])
-            subj_data.loc[(participant_label, session)] = data.T.loc[
-                (participant_label, session)
-            ]
+        metric_files = {
+            metric: TENSOR_METRICS_FILES_TEMPLATE.format(
+                dmriprep_dir=dmriprep_dir,
+                participant_label=participant_label,
+                session=session,
+                metric=metric.lower(),
+            )
+            for metric in multi_column.levels[-1]
+        }
+        inputs = file_signature([image, *metric_files.values()])
+        cache_prefix = f".{out_file.stem}."
+        cache_file = out_file.with_name(
+            f"{cache_prefix}{_digest(np_operation, inputs)}.pkl"
+        )
+        existing = list_directory(out_file.parent)
+        if not force and {out_file.name, cache_file.name} <= existing:
+            session_data = pd.read_pickle(cache_file)
+            values[i] = session_data.reindex(multi_column).to_numpy(float)
+            continue
+        atlas_data = _prepare_atlas(image, next(iter(metric_files.values())))
+        if np_operation in BINCOUNT_OPERATIONS:
+            parcel_index = None
+            label_counts = np.bincount(
+                atlas_data.ravel(), minlength=labels.max() + 1
+            )
         else:
-            for metric in multi_column.levels[-1]:
-                logging.info(metric)
-                metric_file = TENSOR_METRICS_FILES_TEMPLATE.format(
-                    dmriprep_dir=dmriprep_dir,
-                    participant_label=participant_label,
-                    session=session,
-                    metric=metric.lower(),
-                )
-                subj_data.loc[
-                    (participant_label, session), (slice(None), metric)
-                ] = parcellate_image(
-                    image, metric_file, parcels, np_operation
-                ).values
-            subj_data.loc[(participant_label, session)].to_csv(out_file)
-    return subj_data
+            parcel_index = _build_parcel_index(atlas_data)
+            label_counts = None
+        for metric, metric_file in metric_files.items():
+            logger.info(metric)
+            image_data = np.asanyarray(
+                _load_image(file_key(metric_file)).dataobj
+            )
+            values[i, metric_positions[metric]] = _reduce(
+                image_data,
+                atlas_data,
+                labels,
+                np_operation,
+                parcel_index,
+                label_counts,
+            )
+        session_data = pd.Series(
+            values[i],
+            index=multi_column,
+            name=(participant_label, session),
+        )
+        session_data.to_csv(out_file)
+        for name in existing:
+            if name.startswith(cache_prefix) and name.endswith(".pkl"):
+                (out_file.parent / name).unlink()
+        session_data.to_pickle(cache_file)
+    return pd.DataFrame(values, index=multi_index, columns=multi_column)
+
+
+def _dwi2tensor_template(nthreads: int = None) -> str:
+    """
+    *dwi2tensor*'s command template, limited to *nthreads* if given.
+    """
+    template = DWI2TENSOR_COMMAND_TEMPLATE
+    if nthreads is not None:
+        template += " " + MRTRIX_NTHREADS_TEMPLATE
+    return template
 
 
-def dwi2tensor(in_file: Path, grad: Path, out_file: Path):
+def dwi2tensor(
+    in_file: Path, grad: Path, out_file: Path, nthreads: int = None
+):
     """
     Estimate diffusion's tensor via *mrtrix3*'s *dwi2tensor*.
 
@@ -530,6 +1095,8 @@ def dwi2tensor(in_file: Path, grad: Path, out_file: Path):
         DWI gradient table in *mrtrix3*'s format.
     out_file : Path
         Output template
+    nthreads : int, optional
+        Number of threads *dwi2tensor* may use, by default *mrtrix3*'s
 
     Returns
     -------
@@ -539,36 +1106,48 @@ def dwi2tensor(in_file: Path, grad: Path, out_file: Path):
     out_name = out_file.name.split(".")[0]
     out_file = out_file.with_name("." + out_name + ".mif")
     if not out_file.exists():
-        cmd = DWI2TENSOR_COMMAND_TEMPLATE.format(
-            grad=grad, dwi=in_file, out_file=out_file
+        run_command(
+            _dwi2tensor_template(nthreads),
+            grad=grad,
+            dwi=in_file,
+            out_file=out_file,
+            nthreads=nthreads,
         )
-        os.system(cmd)
     return out_file
 
 
-def tensor2metric(
+def tensor2metric_command(
     tensor: Path,
     derivatives: Path,
     participant_label: str,
     session: str,
     metrics: list,
-):
-    """[summary]
+    nthreads: int = None,
+) -> Union[List[str], None]:
+    """
+    Build a single *tensor2metric* command producing all *metrics*.
 
     Parameters
     ----------
     tensor : Path
-        [description]
+        Tensor image, or "-" to read it from standard input
     derivatives : Path
-        [description]
+        Path to derivatives, usually *qsiprep*'s
     participant_label : str
-        [description]
+        A label referring to an existing subject
     session : str
-        [description]
+        A label referring to an existing session
     metrics : list
-        [description]
+        Tensor-derived metrics to produce
+    nthreads : int, optional
+        Number of threads *tensor2metric* may use, by default *mrtrix3*'s
+
+    Returns
+    -------
+    Union[List[str], None]
+        The command's arguments, or None if all *metrics* already exist
     """
-    cmd = "tensor2metric"
+    cmd = ["tensor2metric"]
     flag = []
     for metric in metrics:
         metric_file = TENSOR_METRICS_FILES_TEMPLATE.format(
@@ -577,65 +1156,237 @@ def tensor2metric(
             session=session,
             metric=metric.lower(),
         )
-        if Path(metric_file).exists():
-            flag.append(False)
-        else:
-            flag.append(True)
+        flag.append(not Path(metric_file).exists())
         metric = metric.lower()
-        cmd += f" -{TENSOR2METRIC_KWARGS_MAPPING.get(metric, metric)} {metric_file}"  # noqa: E501
-    cmd += f" {tensor}"
-    if any(flag):
-        os.system(cmd)
+        cmd += [
+            f"-{TENSOR2METRIC_KWARGS_MAPPING.get(metric, metric)}",
+            metric_file,
+        ]
+    cmd.append(str(tensor))
+    if nthreads is not None:
+        cmd += MRTRIX_NTHREADS_TEMPLATE.format(nthreads=nthreads).split()
+    return cmd if any(flag) else None
+
+
+def tensor2metric(
+    tensor: Path,
+    derivatives: Path,
+    participant_label: str,
+    session: str,
+    metrics: list,
+    nthreads: int = None,
+):
+    """
+    Produce tensor-derived *metrics* via *mrtrix3*'s *tensor2metric*, unless
+    they all exist.
+
+    Parameters
+    ----------
+    See *tensor2metric_command*.
+    """
+    cmd = tensor2metric_command(
+        tensor, derivatives, participant_label, session, metrics, nthreads
+    )
+    if cmd is not None:
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+
+
+def _estimate_session_tensors(
+    derivatives_dir: Path,
+    participant_label: str,
+    session: str,
+    metrics: list,
+    nthreads: int = None,
+):
+    """
+    Estimate tensor-derived *metrics* for a single session.
+
+    Parameters
+    ----------
+    derivatives_dir : Path
+        Path to derivatives, usually *qsiprep*'s
+    participant_label : str
+        A label referring to an existing subject
+    session : str
+        A label referring to an existing session
+    metrics : list
+        Tensor-derived metrics to estimate
+    nthreads : int, optional
+        Number of threads each *mrtrix3* command may use
+
+    A failing command is logged rather than raised, so that a single
+    session does not abort the whole cohort.
+    """
+    dwi, grad = [
+        QSIPREP_DWI_TEMPLATE.format(
+            qsiprep_dir=derivatives_dir,
+            participant_label=participant_label,
+            session=session,
+            extension=extension,
+        )
+        for extension in ["nii.gz", "b"]
+    ]
+    tensor = Path(
+        TENSOR_METRICS_FILES_TEMPLATE.format(
+            dmriprep_dir=derivatives_dir,
+            participant_label=participant_label,
+            session=session,
+            metric="tensor",
+        )
+    )
+    tensor = tensor.with_name("." + tensor.name.split(".")[0] + ".mif")
+    try:
+        if tensor.exists():
+            tensor2metric(
+                tensor,
+                derivatives_dir,
+                participant_label,
+                session,
+                metrics,
+                nthreads,
+            )
+            return
+        cmd = tensor2metric_command(
+            "-", derivatives_dir, participant_label, session, metrics, nthreads
+        )
+        if cmd is None:
+            return
+        # Stream the tensor into tensor2metric instead of through disk.
+        pipe_commands(
+            format_command(
+                _dwi2tensor_template(nthreads),
+                grad=grad,
+                dwi=dwi,
+                out_file="-",
+                nthreads=nthreads,
+            ),
+            cmd,
+        )
+
+    except (subprocess.CalledProcessError, OSError) as exc:
+        logger.warning(
+            f"Failed to estimate tensor-derived metrics for subject {participant_label}, session {session}: {exc}"  # noqa: E501
+        )
 
 
 def estimate_tensors(
     parcellations: dict,
     derivatives_dir: Path,
     multi_column: pd.MultiIndex,
+    n_jobs: int = None,
 ):
     """
+    Estimate tensor-derived metrics for all subjects' sessions.
 
     Parameters
     ----------
-    parcellation_scheme : str
-        A string representing a parcellation atlas
     parcellations : dict
         A dictionary with subjects as keys and their corresponding
         *parcellation_scheme* in native space
     derivatives_dir : Path
         Path to derivatives, usually *qsiprep*'s
+    multi_column : pd.MultiIndex
+        A multi-level column with ROI/tensor metrics combinations
+    n_jobs : int, optional
+        Number of sessions processed in parallel, by default
+        *os.cpu_count()*. Available cores are split between the sessions'
+        *mrtrix3* commands to avoid oversubscription.
+    """
+    n_jobs = n_jobs or os.cpu_count()
+    nthreads = max(1, os.cpu_count() // n_jobs)
+    metrics = list(multi_column.levels[-1])
+    sessions = [
+        (participant_label, ses_id)
+        for participant_label in parcellations
+        for ses_id in query_sessions(derivatives_dir, participant_label)
+    ]
+    logger.info(
+        f"Estimating tensor-derived metrics in {len(sessions)} sessions."
+    )
+    results = Parallel(
+        n_jobs=n_jobs, prefer="processes", return_as="generator"
+    )(
+        delayed(_call_with_logging)(
+            (os.getpid(), logger.getEffectiveLevel()),
+            _estimate_session_tensors,
+            derivatives_dir,
+            participant_label,
+            ses_id,
+            metrics,
+            nthreads,
+        )
+        for participant_label, ses_id in sessions
+    )
+    for _ in tqdm.tqdm(
+        results, total=len(sessions), mininterval=PROGRESS_MININTERVAL
+    ):
+        pass
+
+
+def _call_with_logging(parent: tuple, func: Callable, *args):
+    """
+    Call *func* with *args* in a worker process.
+
+    Worker processes do not inherit the application's logging configuration,
+    so unless they have one, logging is configured at the parent's level to
+    keep the module logger's messages from being dropped.
+
+    Parameters
+    ----------
+    parent : tuple
+        The parent's process id and effective logging level
+    func : Callable
+        The function to call
+    """
+    pid, level = parent
+    if os.getpid() != pid and not logging.getLogger().handlers:
+        logging.basicConfig(level=level)
+    return func(*args)
+
+
+def _parcellate_one(
+    dmriprep_dir: Path,
+    participant_label: str,
+    image: Path,
+    multi_column: pd.MultiIndex,
+    parcels: pd.DataFrame,
+    parcellation_scheme: str,
+    cropped_to_gm: bool = True,
+    force: bool = False,
+    np_operation: str = "nanmean",
+) -> Union[pd.DataFrame, None]:
+    """
+    Parcellate *participant_label*'s tensor-derived metrics, or return None if
+    any of its files are missing.
+
+    Parameters
+    ----------
+    See *parcellate_subject_tensors*.
 
     Returns
     -------
-    [type]
-        [description]
+    Union[pd.DataFrame, None]
+        *participant_label*'s parcellated data
     """
-    metrics = multi_column.levels[-1]
-    for participant_label, image in tqdm.tqdm(parcellations.items()):
-        logging.info(
-            f"Estimating tensor-derived metrics in subject {participant_label} anatomical space."  # noqa: E501
+    logger.info(
+        f"Averaging tensor-derived metrics according to {parcellation_scheme} parcels, in subject {participant_label} anatomical space."  # noqa: E501
+    )
+    try:
+        return parcellate_subject_tensors(
+            dmriprep_dir,
+            participant_label,
+            image,
+            multi_column,
+            parcels,
+            parcellation_scheme,
+            cropped_to_gm,
+            force,
+            np_operation,
         )
-        for ses in derivatives_dir.glob(f"sub-{participant_label}/ses-*"):
-            ses_id = ses.name.split("-")[-1]
-            dwi, grad = [
-                QSIPREP_DWI_TEMPLATE.format(
-                    qsiprep_dir=derivatives_dir,
-                    participant_label=participant_label,
-                    session=ses_id,
-                    extension=extension,
-                )
-                for extension in ["nii.gz", "b"]
-            ]
-            tensor = TENSOR_METRICS_FILES_TEMPLATE.format(
-                dmriprep_dir=derivatives_dir,
-                participant_label=participant_label,
-                session=ses_id,
-                metric="tensor",
-            )
-            tensor = dwi2tensor(dwi, grad, Path(tensor))
-            tensor2metric(
-                tensor, derivatives_dir, participant_label, ses_id, metrics
-            )
+    except FileNotFoundError:
+        logger.warning(f"Missing files for subject {participant_label}.")
+    finally:
+        _load_image.cache_clear()
 
 
 def parcellate_tensors(
@@ -647,6 +1398,7 @@ def parcellate_tensors(
     cropped_to_gm: bool = True,
     force: bool = False,
     np_operation: str = "nanmean",
+    n_jobs: int = None,
 ) -> pd.DataFrame:
     """
     Parcellate *dmriprep* derived tensor's metrics according to ROI stated by
@@ -661,33 +1413,45 @@ def parcellate_tensors(
     parcellations : dict
         A dictionary with representing subjects, and values containing paths
         to subjects-space parcellations
+    n_jobs : int, optional
+        Number of subjects processed in parallel, by default
+        *os.cpu_count()*
 
     Returns
     -------
     pd.DataFrame
         An updated *df*
     """
-    data = pd.DataFrame()
-    for participant_label, image in tqdm.tqdm(parcellations.items()):
-        logging.info(
-            f"Averaging tensor-derived metrics according to {parcellation_scheme} parcels, in subject {participant_label} anatomical space."  # noqa: E501
+    results = Parallel(
+        n_jobs=n_jobs or os.cpu_count(),
+        prefer="processes",
+        return_as="generator",
+    )(
+        delayed(_call_with_logging)(
+            (os.getpid(), logger.getEffectiveLevel()),
+            _parcellate_one,
+            dmriprep_dir,
+            participant_label,
+            image,
+            multi_column,
+            parcels,
+            parcellation_scheme,
+            cropped_to_gm,
+            force,
+            np_operation,
         )
-        try:
-            subj_data = parcellate_subject_tensors(
-                dmriprep_dir,
-                participant_label,
-                image,
-                multi_column,
-                parcels,
-                parcellation_scheme,
-                cropped_to_gm,
-                force,
-                np_operation,
-            )
-            data = pd.concat([data, subj_data])
-        except FileNotFoundError:
-            logging.warn(f"Missing files for subject {participant_label}.")
-    return data
+        for participant_label, image in parcellations.items()
+    )
+    frames = [
+        subj_data
+        for subj_data in tqdm.tqdm(
+            results,
+            total=len(parcellations),
+            mininterval=PROGRESS_MININTERVAL,
+        )
+        if subj_data is not None
+    ]
+    return pd.concat(frames) if frames else pd.DataFrame()
 
 
 def at_ants(
@@ -746,9 +1510,17 @@ def apply_mask(mask: Path, target: Path, out_file: Path, threshold: float):
         Thresold to use for masking
     """
     if not out_file.exists():
-        mask_img, target_img = [nib.load(f) for f in [mask, target]]
-        bin_mask = mask_img.get_fdata() > threshold
-        masked_target = target_img.get_fdata().copy()
-        masked_target[~bin_mask] = 0
-        masked_image = nib.Nifti1Image(masked_target, target_img.affine)
+        mask_img, target_img = [
+            nib.load(str(f), mmap=True) for f in [mask, target]
+        ]
+        bin_mask = np.asanyarray(mask_img.dataobj) > threshold
+        del mask_img
+        masked_target = np.asanyarray(target_img.dataobj)
+        if not masked_target.flags.writeable:
+            masked_target = masked_target.copy()
+        np.multiply(masked_target, bin_mask, out=masked_target)
+        del bin_mask
+        masked_image = nib.Nifti1Image(
+            masked_target, target_img.affine, target_img.header
+        )
         nib.save(masked_image, out_file)
@@ -0,0 +1,49 @@
+import logging
+
+import pandas as pd
+
+from brain_parts.parcellation.atlases.brainnetome import (
+    _LazyAtlas,
+    _read_parcels,
+)
+
+
+def test_read_parcels_replaces_unreadable_cache(tmp_path, caplog):
+    path, cache = tmp_path / "parcels.csv", tmp_path / "parcels.pkl"
+    parcels = pd.DataFrame({"Label": [1, 2, 3]}, index=["a", "b", "c"])
+    parcels.to_csv(path)
+    cache.write_bytes(b"truncated")
+
+    with caplog.at_level(logging.WARNING):
+        pd.testing.assert_frame_equal(_read_parcels(path, cache), parcels)
+    assert "unreadable parcels cache" in caplog.text
+    pd.testing.assert_frame_equal(pd.read_pickle(cache), parcels)
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == ".tmp"] == []
+
+
+def test_read_parcels_creates_cache_directory(tmp_path):
+    path = tmp_path / "parcels.csv"
+    cache = tmp_path / "cache" / "brain_parts" / "parcels.pkl"
+    parcels = pd.DataFrame({"Label": [1, 2, 3]}, index=["a", "b", "c"])
+    parcels.to_csv(path)
+
+    pd.testing.assert_frame_equal(_read_parcels(path, cache), parcels)
+    pd.testing.assert_frame_equal(pd.read_pickle(cache), parcels)
+
+
+def test_lazy_atlas_lists_pending_entries():
+    calls = []
+
+    def load():
+        calls.append(None)
+        return "parcels"
+
+    atlas = _LazyAtlas(loaders={"parcels": load}, path="atlas.nii.gz")
+
+    assert "parcels" in atlas
+    assert list(atlas) == ["path", "parcels"]
+    assert len(atlas) == 2
+    assert calls == []
+    assert dict(atlas) == {"path": "atlas.nii.gz", "parcels": "parcels"}
+    assert dict(atlas.items()) == dict(atlas)
+    assert len(calls) == 1
@@ -0,0 +1,319 @@
+import os
+import shutil
+import warnings
+
+import nibabel as nib
+import numpy as np
+import pandas as pd
+import pytest
+
+from brain_parts.parcellation import parcellations
+from brain_parts.parcellation.parcellations import Parcellation
+
+SHAPE = (12, 10, 8)
+LABELS = list(range(1, 13))
+
+
+@pytest.fixture
+def images(tmp_path):
+    rng = np.random.default_rng(42)
+    labels = rng.integers(0, 12, size=SHAPE).astype(np.int16)
+    metric = rng.random(SHAPE).astype(np.float32)
+    metric[rng.random(SHAPE) < 0.1] = np.nan
+    metric[labels == 3] = np.nan
+    paths = {}
+    for name, data in [
+        ("labels", labels),
+        ("FA", metric),
+        ("MD", metric * 2),
+    ]:
+        paths[name] = tmp_path / f"{name}.nii.gz"
+        nib.save(nib.Nifti1Image(data, np.eye(4)), paths[name])
+    return paths, labels, metric
+
+
+@pytest.fixture
+def parcellation():
+    parcels = pd.DataFrame({"Label": LABELS})
+    scheme = {
+        "parcels": parcels,
+        "index": pd.MultiIndex.from_frame(parcels[["Label"]]),
+    }
+    return Parcellation(parcellations={"test": scheme})
+
+
+def expected(labels, metric, measure):
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=RuntimeWarning)
+        return np.array(
+            [
+                measure(metric[labels == label]) if label in labels else np.nan
+                for label in LABELS
+            ]
+        )
+
+
+@pytest.mark.parametrize("measure", [np.nanmean, np.nanmedian, np.nanstd])
+def test_parcellate_image(images, parcellation, measure):
+    paths, labels, metric = images
+    result = parcellation.parcellate_image(
+        "test", paths["labels"], paths["FA"], measure=measure
+    )
+
+    assert result.name == "FA"
+    assert list(result.index.names) == ["Atlas", "Label"]
+    np.testing.assert_allclose(
+        result.values,
+        expected(labels, metric, measure),
+        rtol=1e-5,
+        equal_nan=True,
+    )
+
+
+def test_parcellate_images(images, parcellation):
+    paths, labels, metric = images
+    result = parcellation.parcellate_images(
+        "test", paths["labels"], [paths["FA"], paths["MD"]]
+    )
+
+    assert list(result.columns) == ["FA", "MD"]
+    for name, data in [("FA", metric), ("MD", metric * 2)]:
+        np.testing.assert_allclose(
+            result[name].values,
+            expected(labels, data, np.nanmean),
+            rtol=1e-5,
+            equal_nan=True,
+        )
+
+
+def test_parcellate_image_rewritten_parcellation(images, parcellation):
+    paths, labels, metric = images
+    parcellation.parcellate_image("test", paths["labels"], paths["FA"])
+    labels = labels[::-1].copy()
+    nib.save(nib.Nifti1Image(labels, np.eye(4)), paths["labels"])
+    for measure in [np.nanmean, np.nanmedian]:
+        result = parcellation.parcellate_image(
+            "test", paths["labels"], paths["FA"], measure=measure
+        )
+        np.testing.assert_allclose(
+            result.values,
+            expected(labels, metric, measure),
+            rtol=1e-5,
+            equal_nan=True,
+        )
+
+
+@pytest.mark.parametrize("measure", [np.nanmean, np.nanmedian])
+@pytest.mark.parametrize(
+    "shape", [(12, 10, 9), (13, 10, 8), (11, 10, 8), (12, 10, 8, 3)]
+)
+def test_parcellate_image_shape_mismatch(
+    images, parcellation, tmp_path, shape, measure
+):
+    paths, _, _ = images
+    metric_image = tmp_path / "mismatched.nii.gz"
+    nib.save(
+        nib.Nifti1Image(np.ones(shape, dtype=np.float32), np.eye(4)),
+        metric_image,
+    )
+    with pytest.raises(ValueError, match="does not match"):
+        parcellation.parcellate_image(
+            "test", paths["labels"], metric_image, measure=measure
+        )
+
+
+@pytest.mark.parametrize("measure", [np.nanmean, np.nanmedian])
+def test_parcellate_image_float_labels(images, parcellation, measure):
+    paths, labels, metric = images
+    nib.save(
+        nib.Nifti1Image(labels.astype(np.float32) - 1e-4, np.eye(4)),
+        paths["labels"],
+    )
+    result = parcellation.parcellate_image(
+        "test", paths["labels"], paths["FA"], measure=measure
+    )
+    np.testing.assert_allclose(
+        result.values,
+        expected(labels, metric, measure),
+        rtol=1e-5,
+        equal_nan=True,
+    )
+
+    nib.save(
+        nib.Nifti1Image(labels.astype(np.float32) + 0.6, np.eye(4)),
+        paths["labels"],
+    )
+    with pytest.raises(ValueError, match="non-integral"):
+        parcellation.parcellate_image(
+            "test", paths["labels"], paths["FA"], measure=measure
+        )
+
+
+class CopyTransform:
+    """Stand-in for ApplyTransforms that copies its input to its output."""
+
+    calls = 0
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.cmdline = "antsApplyTransforms"
+        CopyTransform.calls += 1
+
+    def run(self):
+        shutil.copy(self.kwargs["input_image"], self.kwargs["output_image"])
+
+
+def test_register_parcellation_schemes(images, tmp_path, monkeypatch):
+    paths, labels, _ = images
+    monkeypatch.setattr(parcellations, "ApplyTransforms", CopyTransform)
+    monkeypatch.setattr(CopyTransform, "calls", 0)
+    atlases = {"a": labels, "b": labels[::-1]}
+    for name, data in atlases.items():
+        paths[name] = tmp_path / f"{name}.nii.gz"
+        nib.save(nib.Nifti1Image(data, np.eye(4)), paths[name])
+    parcellation = Parcellation(
+        parcellations={name: {"path": paths[name]} for name in atlases}
+    )
+    out_files = [tmp_path / f"native_{name}.nii.gz" for name in atlases]
+    parcellation.register_parcellation_schemes(
+        list(atlases), "01", paths["FA"], "mni2native.h5", out_files
+    )
+
+    assert CopyTransform.calls == 1
+    for data, out_file in zip(atlases.values(), out_files):
+        np.testing.assert_array_equal(nib.load(out_file).get_fdata(), data)
+
+    parcellation.register_parcellation_schemes(
+        list(atlases), "01", paths["FA"], "mni2native.h5", out_files
+    )
+    assert CopyTransform.calls == 1
+
+    nib.save(nib.Nifti1Image(labels[:, ::-1], np.eye(4)), paths["a"])
+    parcellation.register_parcellation_schemes(
+        list(atlases), "01", paths["FA"], "mni2native.h5", out_files
+    )
+    assert CopyTransform.calls == 2
+    np.testing.assert_array_equal(
+        nib.load(out_files[0]).get_fdata(), labels[:, ::-1]
+    )
+
+
+def test_crop_to_probseg(images, tmp_path):
+    paths, labels, metric = images
+    probseg = tmp_path / "sub-01_label-GM_probseg.nii.gz"
+    nib.save(nib.Nifti1Image(np.nan_to_num(metric), np.eye(4)), probseg)
+    out_cropped = tmp_path / "cropped.nii.gz"
+    Parcellation(parcellations={}).crop_to_probseg(
+        "test", "01", paths["labels"], probseg, out_cropped, 0.5
+    )
+
+    mask = np.nan_to_num(metric) >= 0.5
+    np.testing.assert_array_equal(
+        nib.load(tmp_path / "sub-01_label-GM_mask.nii.gz").get_fdata(), mask
+    )
+    np.testing.assert_array_equal(
+        nib.load(out_cropped).get_fdata(), labels * mask
+    )
+
+
+def test_crop_to_probseg_float_labels(images, tmp_path):
+    paths, labels, _ = images
+    nib.save(
+        nib.Nifti1Image(labels.astype(np.float32) + 1e-4, np.eye(4)),
+        paths["labels"],
+    )
+    probseg = tmp_path / "sub-01_label-GM_probseg.nii.gz"
+    nib.save(nib.Nifti1Image(np.ones(SHAPE, np.float32), np.eye(4)), probseg)
+    out_cropped = tmp_path / "cropped.nii.gz"
+    Parcellation(parcellations={}).crop_to_probseg(
+        "test", "01", paths["labels"], probseg, out_cropped, 0.5
+    )
+
+    np.testing.assert_array_equal(nib.load(out_cropped).get_fdata(), labels)
+
+
+def test_crop_to_probseg_partial_mask(images, tmp_path):
+    paths, labels, _ = images
+    probseg_data = np.zeros(SHAPE, dtype=np.float32)
+    probseg_data[3:6, 2:4, 5] = 0.9
+    probseg_data[4, 3, 5] = 0.2
+    probseg = tmp_path / "sub-01_label-GM_probseg.nii.gz"
+    nib.save(nib.Nifti1Image(probseg_data, np.eye(4)), probseg)
+    out_cropped = tmp_path / "cropped.nii.gz"
+    Parcellation(parcellations={}).crop_to_probseg(
+        "test", "01", paths["labels"], probseg, out_cropped, 0.5
+    )
+
+    np.testing.assert_array_equal(
+        nib.load(out_cropped).get_fdata(), labels * (probseg_data >= 0.5)
+    )
+
+
+def test_register_participants(images, tmp_path, monkeypatch):
+    paths, labels, _ = images
+    monkeypatch.setattr(parcellations, "ApplyTransforms", CopyTransform)
+    parcellation = Parcellation(
+        parcellations={"test": {"path": paths["labels"]}}
+    )
+    participants = {
+        label: (paths["FA"], "mni2native.h5", [tmp_path / f"{label}.nii.gz"])
+        for label in ["01", "02"]
+    }
+    parcellation.register_participants(["test"], participants, n_jobs=1)
+
+    for _, _, (out_file,) in participants.values():
+        np.testing.assert_array_equal(nib.load(out_file).get_fdata(), labels)
+
+
+def test_register_keeps_bids_sidecar(images, tmp_path, monkeypatch):
+    paths, labels, _ = images
+    monkeypatch.setattr(parcellations, "ApplyTransforms", CopyTransform)
+    out_file = tmp_path / "sub-01_atlas-test_dseg.nii.gz"
+    bids_sidecar = tmp_path / "sub-01_atlas-test_dseg.json"
+    bids_sidecar.write_text('{"Description": "test"}')
+    Parcellation(
+        parcellations={"test": {"path": paths["labels"]}}
+    ).register_participants(
+        ["test"], {"01": (paths["FA"], "mni2native.h5", [out_file])}, n_jobs=1
+    )
+
+    assert bids_sidecar.read_text() == '{"Description": "test"}'
+    assert (tmp_path / "sub-01_atlas-test_dseg.registration.json").exists()
+
+
+FAKE_ANTS = """#!/bin/sh
+echo "$ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS" >> "{log}"
+while [ $# -gt 0 ]; do
+    case "$1" in
+        --input) in="$2"; shift 2;;
+        --output) out="$2"; shift 2;;
+        *) shift;;
+    esac
+done
+cp "$in" "$out"
+"""
+
+
+def test_register_participants_in_processes(images, tmp_path, monkeypatch):
+    paths, labels, _ = images
+    bin_dir, log = tmp_path / "bin", tmp_path / "ants.log"
+    bin_dir.mkdir()
+    ants = bin_dir / "antsApplyTransforms"
+    ants.write_text(FAKE_ANTS.format(log=log))
+    ants.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    transform = tmp_path / "mni2native.h5"
+    transform.touch()
+    parcellation = Parcellation(
+        parcellations={"test": {"path": paths["labels"]}}
+    )
+    participants = {
+        label: (paths["FA"], transform, [tmp_path / f"{label}.nii.gz"])
+        for label in ["01", "02"]
+    }
+    parcellation.register_participants(["test"], participants, n_jobs=2)
+
+    for _, _, (out_file,) in participants.values():
+        np.testing.assert_array_equal(nib.load(out_file).get_fdata(), labels)
+    num_threads = str(max(1, os.cpu_count() // 2))
+    assert log.read_text().split() == [num_threads, num_threads]
@@ -0,0 +1,260 @@
+import os
+import subprocess
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pandas as pd
+import pytest
+
+from brain_parts.parcellation import utils
+from brain_parts.parcellation.utils import generate_default_args
+
+
+def test_generate_default_args():
+    freesurfer_dir = Path("/freesurfer")
+    args = generate_default_args(freesurfer_dir, "sub-01")
+    subject_dir = freesurfer_dir / "sub-01"
+
+    assert args["subject_id"] == "sub-01"
+    assert args["subjects_dir"] == freesurfer_dir
+    assert args["lh_pial"] == subject_dir / "surf" / "lh.pial"
+    assert args["rh_white"] == subject_dir / "surf" / "rh.white"
+    assert args["aseg"] == subject_dir / "mri" / "aseg.presurf.mgz"
+    assert args["tabular_output"] is True
+
+
+def test_prepare_atlas_resamples_rewritten_atlas(tmp_path):
+    atlas, reference = tmp_path / "atlas.nii.gz", tmp_path / "ref.nii.gz"
+    nib.save(
+        nib.Nifti1Image(np.zeros((8, 8, 8), dtype=np.float32), np.eye(4)),
+        reference,
+    )
+    affine = np.diag([2.0, 2.0, 2.0, 1.0])
+    for label in [1, 2]:
+        nib.save(
+            nib.Nifti1Image(np.full((4, 4, 4), label, np.int16), affine),
+            atlas,
+        )
+        os.utime(atlas, ns=(label * 10**9, label * 10**9))
+        atlas_data = utils._prepare_atlas(atlas, reference)
+
+        assert atlas_data.shape == (8, 8, 8)
+        assert atlas_data.max() == label
+    assert len(list(tmp_path.glob("atlas_res-*.nii.gz"))) == 2
+
+
+@pytest.fixture
+def tensor_tree(tmp_path):
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 4, size=(6, 5, 4)).astype(np.int16)
+    image = tmp_path / "sub-01_atlas.nii.gz"
+    nib.save(nib.Nifti1Image(labels, np.eye(4)), image)
+    metric_files = {}
+    for metric in ["FA", "MD"]:
+        metric_files[metric] = Path(
+            utils.TENSOR_METRICS_FILES_TEMPLATE.format(
+                dmriprep_dir=tmp_path,
+                participant_label="01",
+                session="a",
+                metric=metric.lower(),
+            )
+        )
+        metric_files[metric].parent.mkdir(parents=True, exist_ok=True)
+        write_metric(metric_files[metric], rng.random(labels.shape))
+    # Laid out like the shipped parcels tables: labels in a column.
+    parcels = pd.DataFrame({"Label": [1, 2, 3]})
+    multi_column = pd.MultiIndex.from_product([parcels.index, ["FA", "MD"]])
+    return tmp_path, image, labels, metric_files, parcels, multi_column
+
+
+def test_parcellate_image_reads_label_column(tensor_tree):
+    _, image, labels, metric_files, parcels, _ = tensor_tree
+    data = nib.load(metric_files["FA"]).get_fdata()
+    for np_operation in ["nanmean", "nanmedian"]:
+        result = utils.parcellate_image(
+            image, metric_files["FA"], parcels, np_operation
+        )
+
+        assert result.index.equals(parcels.index)
+        np.testing.assert_allclose(
+            result,
+            [
+                utils.NP_OPERATIONS[np_operation](data[labels == label])
+                for label in parcels["Label"]
+            ],
+            rtol=1e-5,
+        )
+
+
+def write_metric(path, data):
+    nib.save(nib.Nifti1Image(data.astype(np.float32), np.eye(4)), path)
+    mtime = path.stat().st_mtime_ns + 10**9
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_parcellate_subject_tensors_caches(tensor_tree, monkeypatch):
+    tmp_path, image, labels, metric_files, parcels, multi_column = tensor_tree
+    calls = []
+    reduce = utils._reduce
+
+    def counting_reduce(*args):
+        calls.append(args)
+        return reduce(*args)
+
+    monkeypatch.setattr(utils, "_reduce", counting_reduce)
+
+    def parcellate(**kwargs):
+        calls.clear()
+        return utils.parcellate_subject_tensors(
+            tmp_path, "01", image, multi_column, parcels, "test", **kwargs
+        )
+
+    def expected(metric):
+        data = nib.load(metric_files[metric]).get_fdata()
+        return [data[labels == label].mean() for label in parcels["Label"]]
+
+    result = parcellate()
+    assert len(calls) == 2
+    assert all(args[5] is not None for args in calls)
+    for metric in ["FA", "MD"]:
+        np.testing.assert_allclose(
+            result.xs(metric, axis=1, level=1).iloc[0],
+            expected(metric),
+            rtol=1e-5,
+        )
+
+    pd.testing.assert_frame_equal(parcellate(), result)
+    assert calls == []
+
+    out_dir = metric_files["FA"].parent
+    assert len(list(out_dir.glob(".*.pkl"))) == 1
+    write_metric(metric_files["FA"], np.ones(labels.shape))
+    result = parcellate()
+    assert len(calls) == 2
+    np.testing.assert_allclose(result.xs("FA", axis=1, level=1), 1)
+    assert len(list(out_dir.glob(".*.pkl"))) == 1
+
+    for csv in out_dir.glob("*.csv"):
+        csv.unlink()
+    parcellate()
+    assert len(calls) == 2
+    assert len(list(out_dir.glob("*.csv"))) == 1
+
+    parcellate(force=True)
+    assert len(calls) == 2
+
+    parcellate(np_operation="mean")
+    assert len(calls) == 2
+
+    parcellate(np_operation="nanmedian")
+    assert len(calls) == 2
+    assert all(args[4] is not None for args in calls)
+
+
+class TouchInterface:
+    def __init__(self, out_file):
+        self.out_file = out_file
+
+    def run(self):
+        Path(self.out_file).touch()
+
+
+def test_run_interface_logs_only_when_run(tmp_path, caplog):
+    out_file = tmp_path / "out.annot"
+    with caplog.at_level("INFO", logger=utils.logger.name):
+        for _ in range(2):
+            utils.run_interface(
+                TouchInterface, [], [out_file], "Generating", out_file=out_file
+            )
+
+    assert [record.getMessage() for record in caplog.records] == [
+        "Generating",
+        f"Reusing existing {out_file}.",
+    ]
+
+
+def test_format_command():
+    cmd = utils.format_command(
+        "aparcstats2table --subjects {subjects} --tablefile={out_file}",
+        subjects=["sub-01", "sub-02"],
+        out_file=Path("/a dir/table.tsv"),
+    )
+
+    assert cmd == [
+        "aparcstats2table",
+        "--subjects",
+        "sub-01",
+        "sub-02",
+        "--tablefile=/a dir/table.tsv",
+    ]
+
+
+@pytest.mark.parametrize(
+    "producer,consumer,returncode",
+    [
+        (["sh", "-c", "echo tensor"], ["cat"], None),
+        (["yes"], ["head", "-n", "1"], None),
+        (["sh", "-c", "echo tensor"], ["sh", "-c", "cat; exit 3"], 3),
+        (["sh", "-c", "exit 2"], ["cat"], 2),
+        (["sh", "-c", "exit 2"], ["sh", "-c", "cat; exit 3"], 2),
+    ],
+)
+def test_pipe_commands(producer, consumer, returncode):
+    if returncode is None:
+        utils.pipe_commands(producer, consumer)
+    else:
+        with pytest.raises(subprocess.CalledProcessError) as error:
+            utils.pipe_commands(producer, consumer)
+        assert error.value.returncode == returncode
+
+
+def test_estimate_tensors_logs_failed_sessions(tmp_path, monkeypatch, caplog):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name, script in [("dwi2tensor", "exit 1"), ("tensor2metric", "cat")]:
+        (bin_dir / name).write_text(f"#!/bin/sh\n{script}\n")
+        (bin_dir / name).chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    for session in ["a", "b"]:
+        (tmp_path / "sub-01" / f"ses-{session}").mkdir(parents=True)
+    multi_column = pd.MultiIndex.from_product([[1], ["FA", "MD"]])
+
+    utils.estimate_tensors({"01": None}, tmp_path, multi_column, n_jobs=1)
+
+    assert [record.levelname for record in caplog.records].count(
+        "WARNING"
+    ) == 2
+
+
+@pytest.mark.parametrize(
+    "data,dtype",
+    [
+        (np.array([0, 1, 255], dtype=np.int16), np.uint8),
+        (np.array([0, 1, 256], dtype=np.int16), np.uint16),
+        (np.array([0.0, 1.0, 2.0]), np.uint8),
+        (np.array([0.0, 1.0, 2.9999]), np.uint8),
+    ],
+)
+def test_prepare_atlas_dtype(tmp_path, data, dtype):
+    atlas = tmp_path / "atlas.nii.gz"
+    nib.save(nib.Nifti1Image(data.reshape(3, 1, 1), np.eye(4)), atlas)
+    atlas_data = utils._prepare_atlas(atlas, atlas)
+
+    assert atlas_data.dtype == dtype
+    np.testing.assert_array_equal(atlas_data.ravel(), np.rint(data))
+
+
+@pytest.mark.parametrize("np_operation", ["nanmean", "nanmedian"])
+@pytest.mark.parametrize(
+    "value,match",
+    [(1.6, "non-integral"), (np.nan, "non-integral"), (-1, "negative")],
+)
+def test_parcellate_image_invalid_labels(tmp_path, value, match, np_operation):
+    atlas, image = tmp_path / "atlas.nii.gz", tmp_path / "image.nii.gz"
+    data = np.array([0.0, 1.0, value], dtype=np.float32).reshape(3, 1, 1)
+    nib.save(nib.Nifti1Image(data, np.eye(4)), atlas)
+    nib.save(nib.Nifti1Image(np.ones_like(data), np.eye(4)), image)
+    parcels = pd.DataFrame({"Label": [1]})
+    with pytest.raises(ValueError, match=match):
+        utils.parcellate_image(atlas, image, parcels, np_operation)